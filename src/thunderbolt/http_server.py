@@ -257,13 +257,14 @@ class HttpServer:
         await writer.drain()
         writer.close()
         await writer.wait_closed()
-        elapsed = milliseconds() - t0
-        if http_status == HTTP_STATUS_OK:
-            logging.info(f'{partner} {request} {http_status} {bytes_sent} {elapsed} ms',
-                         'http_server:serve_http_client')
-        else:
-            logging.info(f'{partner} {request} {http_status} {bytes_sent} {elapsed} ms',
-                         'http_server:serve_http_client')
+        if logging.should_log(logging.INFO):
+            elapsed = milliseconds() - t0
+            if http_status == HTTP_STATUS_OK:
+                logging.info(f'{partner} {request} {http_status} {bytes_sent} {elapsed} ms',
+                             'http_server:serve_http_client')
+            else:
+                logging.info(f'{partner} {request} {http_status} {bytes_sent} {elapsed} ms',
+                             'http_server:serve_http_client')
         gc.collect()
 
 #
@@ -32,6 +32,7 @@ __version__ = '0.9.2'
 # pylint: disable=E0401
 
 import json
+import os
 
 from http_server import (HttpServer,
                          api_rename_file_callback,
@@ -40,18 +41,26 @@ from http_server import (HttpServer,
                          api_get_files_callback)
 from thunderbolt import Thunderbolt
 from morse_code import MorseCode
-from utils import upython, safe_int
+from utils import upython, safe_int, valid_ipv4
 from picow_network import PicowNetwork
 
 
 if upython:
     import machine
+    import time
     import micro_logging as logging
     import uasyncio as asyncio
+    asyncio_run = asyncio.run
 else:
     import asyncio
 #    import logging
     import micro_logging as logging
+    try:
+        import uvloop  # optional, a faster event loop for cpython.
+        # uvloop.run() (uvloop 0.18 and up) replaces install(), which is deprecated on python 3.12 and up.
+        asyncio_run = uvloop.run
+    except (ImportError, AttributeError):
+        asyncio_run = asyncio.run
 
 
     class Machine:
@@ -103,12 +112,45 @@ DEFAULT_SECRET = 'thunderbolt'
 DEFAULT_SSID = 'thunderbolt'
 DEFAULT_WEB_PORT = 80
 
+# config fields that can be set by POST /api/config, and how they are validated.
+CONFIG_STR_FIELDS = {  # name: (min length, max length)
+    'SSID': (1, 63),
+    'secret': (8, 31),
+    'username': (1, 16),
+    'password': (1, 16),
+    'hostname': (1, 16),
+}
+CONFIG_INT_FIELDS = {  # name: (min value, max value), value is stored as received.
+    'tcp_port': (0, 65535),
+    'web_port': (0, 65535),
+}
+CONFIG_BOOL_FIELDS = ('ap_mode', 'dhcp')  # 1 or '1' is True, anything else is False.
+CONFIG_IPV4_FIELDS = ('ip_address', 'netmask', 'gateway', 'dns_server')  # dotted quad, may be empty only when using DHCP.
+
 # globals...
 keep_running = True
 thunderbolt = None
+reset_button_pressed_tm = 0  # ticks_ms when the reset button was pressed, 0 when not pressed.
+_config_cache = None  # parsed config, so it is only read from flash once
+_config_mtime = None  # modification time of CONFIG_FILE when it was cached
+_config_json = None  # GET /api/config response, built from the cached config
 
 
-def read_config():
+def config_file_mtime():
+    try:
+        return os.stat(CONFIG_FILE)[8]
+    except OSError:
+        return None
+
+
+def read_config(check_file=False):
+    # returns the cached config. check_file will reload it if the file was changed
+    # by something else, like a file upload.
+    global _config_cache, _config_mtime, _config_json
+    if _config_cache is not None:
+        if not check_file or config_file_mtime() == _config_mtime:
+            return _config_cache
+    mtime = config_file_mtime()
     try:
         with open(CONFIG_FILE, 'r') as config_file:
             config = json.load(config_file)
@@ -127,12 +169,36 @@ def read_config():
             'dns_server': '8.8.8.8',
             'web_port': str(DEFAULT_WEB_PORT),
         }
+    _config_cache = config
+    _config_mtime = mtime
+    _config_json = None
     return config
 
 
+def read_config_json():
+    # the config as JSON, without the secret.  cached until the config is saved or reloaded.
+    global _config_json
+    config = read_config(check_file=True)
+    if _config_json is None:
+        payload = {k: v for k, v in config.items() if k != 'secret'}  # do not return the secret
+        _config_json = json.dumps(payload).encode('utf-8')
+    return _config_json
+
+
 def save_config(config):
+    global _config_cache, _config_mtime, _config_json
     with open(CONFIG_FILE, 'w') as config_file:
         json.dump(config, config_file)
+    _config_cache = config
+    _config_mtime = config_file_mtime()
+    _config_json = None
+
+
+# noinspection PyUnusedLocal
+def reset_button_handler(pin):  # reset button falling edge IRQ handler
+    global reset_button_pressed_tm
+    if reset_button_pressed_tm == 0:
+        reset_button_pressed_tm = time.ticks_ms() or 1  # 0 means not pressed
 
 
 # noinspection PyUnusedLocal
@@ -145,92 +211,42 @@ async def slash_callback(http, verb, args, reader, writer, request_headers=None)
 # noinspection PyUnusedLocal
 async def api_config_callback(http, verb, args, reader, writer, request_headers=None):  # callback for '/api/config'
     if verb == 'GET':
-        payload = read_config()
-        payload.pop('secret')  # do not return the secret
-        response = json.dumps(payload).encode('utf-8')
+        response = read_config_json()
         http_status = 200
         bytes_sent = http.send_simple_response(writer, http_status, http.CT_APP_JSON, response)
     elif verb == 'POST':
-        config = read_config()
+        config = dict(read_config())  # work on a copy, the cache is only replaced when it is saved.
         dirty = False
         errors = False
-        tcp_port = args.get('tcp_port')
-        if tcp_port is not None:
-            tcp_port_int = safe_int(tcp_port, -2)
-            if 0 <= tcp_port_int <= 65535:
-                config['tcp_port'] = tcp_port
-                dirty = True
-            else:
-                errors = True
-        web_port = args.get('web_port')
-        if web_port is not None:
-            web_port_int = safe_int(web_port, -2)
-            if 0 <= web_port_int <= 65535:
-                config['web_port'] = web_port
-                dirty = True
-            else:
-                errors = True
-        ssid = args.get('SSID')
-        if ssid is not None:
-            if 0 < len(ssid) < 64:
-                config['SSID'] = ssid
-                dirty = True
-            else:
-                errors = True
-        secret = args.get('secret')
-        if secret is not None:
-            if 8 <= len(secret) < 32:
-                config['secret'] = secret
-                dirty = True
-            else:
-                errors = True
-        remote_username = args.get('username')
-        if remote_username is not None:
-            if 1 <= len(remote_username) <= 16:
-                config['username'] = remote_username
-                dirty = True
-            else:
-                errors = True
-        remote_password = args.get('password')
-        if remote_password is not None:
-            if 1 <= len(remote_password) <= 16:
-                config['password'] = remote_password
-                dirty = True
+        for name, value in args.items():
+            if value is None:
+                continue  # null in the POST means not set, ignore it.
+            if name in CONFIG_STR_FIELDS:
+                min_len, max_len = CONFIG_STR_FIELDS[name]
+                if not min_len <= len(value) <= max_len:
+                    errors = True
+                    continue
+            elif name in CONFIG_INT_FIELDS:
+                min_value, max_value = CONFIG_INT_FIELDS[name]
+                if not min_value <= safe_int(value, -2) <= max_value:
+                    errors = True
+                    continue
+            elif name in CONFIG_BOOL_FIELDS:
+                value = value in (1, '1')
+            elif name in CONFIG_IPV4_FIELDS:
+                if value != '' and not valid_ipv4(value):
+                    errors = True
+                    continue
             else:
-                errors = True
-        ap_mode_arg = args.get('ap_mode')
-        if ap_mode_arg is not None:
-            ap_mode = ap_mode_arg == '1'
-            config['ap_mode'] = ap_mode
-            dirty = True
-        dhcp_arg = args.get('dhcp')
-        if dhcp_arg is not None:
-            dhcp = dhcp_arg == 1
-            config['dhcp'] = dhcp
-            dirty = True
-        hostname = args.get('hostname')
-        if hostname is not None:
-            if 1 <= len(hostname) <= 16:
-                config['hostname'] = hostname
+                continue  # not a config field, ignore it.
+            if config.get(name) != value:
+                config[name] = value
                 dirty = True
-            else:
-                errors = True
-        ip_address = args.get('ip_address')
-        if ip_address is not None:
-            config['ip_address'] = ip_address
-            dirty = True
-        netmask = args.get('netmask')
-        if netmask is not None:
-            config['netmask'] = netmask
-            dirty = True
-        gateway = args.get('gateway')
-        if gateway is not None:
-            config['gateway'] = gateway
-            dirty = True
-        dns_server = args.get('dns_server')
-        if dns_server is not None:
-            config['dns_server'] = dns_server
-            dirty = True
+        if not config.get('dhcp', True):
+            # a static IP config needs all the addresses, or the network will not start after the restart.
+            for name in CONFIG_IPV4_FIELDS:
+                if not config.get(name):
+                    errors = True
         if not errors:
             if dirty:
                 save_config(config)
@@ -273,7 +289,7 @@ async def api_status_callback(http, verb, args, reader, writer, request_headers=
 
 
 async def main():
-    global keep_running, thunderbolt
+    global keep_running, thunderbolt, reset_button_pressed_tm
 
     logging.info('Starting...', 'main:main')
 
@@ -300,6 +316,7 @@ async def main():
         thunderbolt = Thunderbolt(port_name=thunderbolt_port)
         logging.info(f'Starting Thunderbolt serial port service', 'main:main')
         thunderbolt_server = asyncio.create_task(thunderbolt.serial_server())
+        thunderbolt_processor = asyncio.create_task(thunderbolt.processor())
         thunderbolt_alarms = asyncio.create_task(thunderbolt.alarm_server(status_led, failed_led))
 
     http_server = HttpServer(content_dir='content/')
@@ -317,30 +334,26 @@ async def main():
     logging.info(f'Starting web service on port {web_port}', 'main:main')
     web_server = asyncio.create_task(asyncio.start_server(http_server.serve_http_client, '0.0.0.0', web_port))
 
-    reset_button_pressed_count = 0
-    four_count = 0
+    if upython:
+        reset_button.irq(trigger=machine.Pin.IRQ_FALLING, handler=reset_button_handler)
+
     last_message = ''
     while keep_running:
         if upython:
-            await asyncio.sleep(0.25)
-            four_count += 1
-            pressed = reset_button.value() == 0
-            if pressed:
-                reset_button_pressed_count += 1
-            else:
-                if reset_button_pressed_count > 0:
-                    reset_button_pressed_count -= 1
-            if reset_button_pressed_count > 7:
-                logging.info('reset button pressed', 'main:main')
-                ap_mode = not ap_mode
-                config['ap_mode'] = ap_mode
-                save_config(config)
-                keep_running = False
-            if four_count >= 3:  # check for new message every one second
-                if picow_network.get_message() != last_message:
-                    last_message = picow_network.get_message()
-                    morse_code_sender.set_message(last_message)
-                four_count = 0
+            await asyncio.sleep(1.0)
+            if reset_button_pressed_tm != 0:
+                if reset_button.value() != 0:
+                    reset_button_pressed_tm = 0  # released, or it was a bounce.
+                elif time.ticks_diff(time.ticks_ms(), reset_button_pressed_tm) > 2000:
+                    logging.info('reset button pressed', 'main:main')
+                    ap_mode = not ap_mode
+                    config['ap_mode'] = ap_mode
+                    save_config(config)
+                    keep_running = False
+            # check for new message every one second
+            if picow_network.get_message() != last_message:
+                last_message = picow_network.get_message()
+                morse_code_sender.set_message(last_message)
         else:
             await asyncio.sleep(10.0)
     if upython:
@@ -352,7 +365,7 @@ if __name__ == '__main__':
     # logging.loglevel = logging.DEBUG
     logging.info('starting', 'main:__main__')
     try:
-        asyncio.run(main())
+        asyncio_run(main())
     except KeyboardInterrupt:
         logging.info('bye', 'main:__main__')
     finally:
@@ -23,7 +23,7 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
 OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-__version__ = '0.0.5'
+__version__ = '0.0.6'
 
 from utils import get_timestamp, upython
 
@@ -43,9 +43,13 @@ loglevel = ERROR
 # this is used to determine if logging.level() methods should be called,
 # purpose is to reduce heap pollution from building complex log messages.
 def should_log(level):
-    return level >= loglevel
+    return loglevel >= level
 
-def _log(level: str, message: str, caller=None):
+# any args are %-formatted into message, like python logging.  that is only done when the level is enabled,
+# so it costs less than building an f-string that may not be logged.
+def _log(level: str, message: str, caller=None, args=None):
+    if args:
+        message = message % args
     level = '[' + level + ']'
     if caller is None:
         print(f'{get_timestamp()} {level:<11s} {message}')
@@ -53,24 +57,24 @@ def _log(level: str, message: str, caller=None):
         print(f'{get_timestamp()} {level:<11s} [{caller}] {message}')
 
 
-def debug(message, caller=None):
+def debug(message, caller=None, *args):
     if loglevel >= DEBUG:
-        _log('DEBUG', message, caller)
+        _log('DEBUG', message, caller, args)
 
 
-def info(message, caller=None):
+def info(message, caller=None, *args):
     if loglevel >= INFO:
-        _log('INFO', message, caller)
+        _log('INFO', message, caller, args)
 
 
-def warning(message, caller=None):
+def warning(message, caller=None, *args):
     if loglevel >= WARNING:
-        _log('WARNING', message, caller)
+        _log('WARNING', message, caller, args)
 
 
-def error(message, caller=None):
+def error(message, caller=None, *args):
     if loglevel >= ERROR:
-        _log('ERROR', message, caller)
+        _log('ERROR', message, caller, args)
 
 
 def exception(message:str, caller:str = None, exc_info:Exception = None) -> None:
@@ -80,7 +84,7 @@ def exception(message:str, caller:str = None, exc_info:Exception = None) -> None
         _log('EXCEPTION', message, caller)
 
 
-def critical(message, caller=None):
+def critical(message, caller=None, *args):
     if loglevel >= CRITICAL:
-        _log('CRITICAL', message, caller)
+        _log('CRITICAL', message, caller, args)
 
@@ -275,12 +275,12 @@ class PicowNetwork:
         sleep = asyncio.sleep
         while self.keepalive:
             connected = self.is_connected()
-            logging.debug(f'self.is_connected() = {self.is_connected()}','PicowNetwork.keepalive')
+            logging.debug('self.is_connected() = %s', 'PicowNetwork.keepalive', connected)
             if not connected:
                 logging.warning('not connected...  attempting network connect...', 'PicowNetwork:keep_alive')
                 await self.connect()
             else:
-                logging.debug(f'connected = {connected}', 'PicowNetwork.keepalive')
+                logging.debug('connected = %s', 'PicowNetwork.keepalive', connected)
             await sleep(5)  # check network every 5 seconds
         logging.info('keepalive exit', 'PicowNetwork.keepalive loop exit.')
 
@@ -35,6 +35,7 @@ impl_name = sys.implementation.name
 upython = impl_name == 'micropython'
 if upython:
     import machine
+    import uasyncio as asyncio
 else:
     import serial
 
@@ -72,6 +73,7 @@ class SerialPort:
                                      rx=rx_pin)
         else:
             raise RuntimeError(f'no support for {impl_name}.')
+        self.stream = None
 
     def close(self):
         self.port.close()
@@ -80,8 +82,7 @@ class SerialPort:
         if upython:
             return self.port.any()
         else:
-            x = self.port.in_waiting
-            return x != 0
+            return self.port.in_waiting
 
     def flush_input(self):
         if upython:
@@ -97,9 +98,20 @@ class SerialPort:
         buffer = self.port.read(size)
         return b'' if buffer is None else buffer  # micropython machine.UART returns None on timeout.
 
+    async def read_async(self, size=16):
+        # micropython only.  waits for the UART to be readable (IRQ driven) instead of polling any().
+        if self.stream is None:
+            self.stream = asyncio.StreamReader(self.port)
+        buffer = await self.stream.read(size)
+        return b'' if buffer is None else buffer
+
     def readinto(self, buf):
         result = self.port.readinto(buf)
         return 0 if result is None else result
 
     def flush(self):
         self.port.flush()
+
+    def fileno(self):
+        # cpython only.  pyserial has no file descriptor on windows, this raises there.
+        return self.port.fileno()
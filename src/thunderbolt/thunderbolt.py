@@ -30,11 +30,12 @@ There is code to parse data out of most of the TSIP messages, every one that I s
 A lot of the data parsing is commented out in the interest of time and space.
 """
 
+import binascii
 import gc
 import struct
 
 from serialport import SerialPort
-from utils import upython, milliseconds, get_timestamp_from_secs
+from utils import upython, milliseconds, milliseconds_diff, get_timestamp_from_secs
 
 if upython:
     import micro_logging as logging
@@ -43,27 +44,38 @@ else:
     import asyncio
     import micro_logging as logging
 
+    def const(i):
+        return i
+
 # message bytes
-ETX = 0x03  # end of message
-DLE = 0x10  # start of message
+ETX = const(0x03)  # end of message
+DLE = const(0x10)  # start of message
+DLE_BYTES = b'\x10'  # for bytes.find()
+# 8E A5 set packet broadcast mask: enable the 0x8f-ab and 0x8f-ac timing packets, and the automatic packets.
+INIT_8E_A5 = b'\x10\x8e\xa5\x00\x45\x00\x00\x10\x03'
 
 # these are packets that I don't care about.  They are safe to ignore.
-ignore_packets = [0x43, 0x45, 0x47, 0x49,
-                  0x55, 0x56, 0x57, 0x58,
-                  0x59, 0x5a, 0x5b, 0x5c,
-                  0x5f, 0x70, 0x83, 0x84,
-                  0xbb]
-ignore_8f_packets = [0x15, 0x41, 0x42, 0x4a,
-                     0x4c, 0xa0, 0xa1, 0xa2,
-                     0xa5, 0xa7, 0xa8, 0xa9]
+# frozensets, so the check is a hash lookup instead of a scan of a list.
+ignore_packets = frozenset((0x43, 0x45, 0x47, 0x49,
+                            0x55, 0x56, 0x57, 0x58,
+                            0x59, 0x5a, 0x5b, 0x5c,
+                            0x5f, 0x70, 0x83, 0x84,
+                            0xbb))
+ignore_8f_packets = frozenset((0x15, 0x41, 0x42, 0x4a,
+                               0x4c, 0xa0, 0xa1, 0xa2,
+                               0xa5, 0xa7, 0xa8, 0xa9))
 
 # state machine states
-RS_INIT = 0  # initial reader state, waiting for DLE
-RS_READ = 1  # reading data into buffer
-RS_READ_DLE = 2  # reading data, last was DLE
+# these are const() so micropython compiles them into the framer instead of looking them up on every pass.
+RS_INIT = const(0)  # initial reader state, waiting for DLE
+RS_READ = const(1)  # reading data into buffer
+RS_READ_DLE = const(2)  # reading data, last was DLE
 
 # size of serial buffer
-BUFFER_SIZE = 256  # message 0x58 can be 170 bytes.
+BUFFER_SIZE = const(256)  # message 0x58 can be 170 bytes.
+STALE_MS = const(5000)  # not connected when no message has been seen for this long.
+GC_PASSES = const(6)  # alarm_server runs gc.collect() every 6 passes (about 30 seconds) while connected.
+RX_QUEUE_SIZE = const(8)  # framed messages waiting for processor(); the oldest is dropped when full.
 
 # GPS Epoch date (January 6, 1980 at 00:00Z) as Unix Time
 GPS_EPOCH_AS_UNIX_TIME = 315964800
@@ -72,10 +84,26 @@ WEEK_SECONDS = 7 * 86400
 DEGREES_RADIAN = 57.29578
 FEET_METER = 3.2808398950131
 
+# struct formats for the packets that are parsed.
+# micropython's struct has no Struct class, so build the format strings once, here.
+PRN_6D_OFFSET = const(18)  # satellite selection list, '>xBffff' header then one signed byte per satellite
+FMT_8F_AB = '>xxIHhBBBBBBH'  # primary timing packet
+FMT_8F_AC = '>xxBBBIHHBBBBffIffdddxxxxxxxx'  # secondary timing packet
+# the formats include the two ID bytes, so these are the whole packet lengths.
+LEN_8F_AB = struct.calcsize(FMT_8F_AB)
+LEN_8F_AC = struct.calcsize(FMT_8F_AC)
+MAX_6D_SATS = const(32)  # more than that is a bad packet
+# 0x6d fix dimension bits -> fix_dim: 0 no fix, 1 1d clock fix, 3 2d fix, 4 3d fix, 5 OD clock fix.
+# 2, 6 and 7 are not implemented, and map to 0.
+FIX_DIM_MAP = (0, 1, 0, 2, 3, 5, 0, 0)
+_fmt_6d_cache = {}  # 0x6d PRN list formats, keyed by number of satellites
+# hexdump_buffer's text column, indexed by byte value.
+PRINTABLE_CHARS = tuple(chr(i) if 32 <= i <= 126 else '.' for i in range(256))
+
 
 class Thunderbolt:
     def __init__(self, port_name):
-        logging.debug(f'Initializing Thunderbolt class, port_name={port_name}')
+        logging.debug('Initializing Thunderbolt class, port_name=%s', 'thunderbolt:__init__', port_name)
         self.port_name = port_name
         self.device_port = SerialPort(name=port_name, baudrate=9600, timeout=0)  # timeout is zero for non-blocking
         self.run = True
@@ -95,284 +123,447 @@ class Thunderbolt:
         self.time_of_week = 0
         self.week_number = 0
         self.utc_offset = 0
-        self.tm = ''
+        self.unix_time = GPS_EPOCH_AS_UNIX_TIME
+        self._datetime = ''  # get_datetime's last result, for _datetime_secs
+        self._datetime_secs = -1
+        self.hours = -1  # time of day from 0x8f-ab, -1 until the first one is seen.
+        self.minutes = 0
+        self.seconds = 0
         self.last_seen_tm = 0
+        self._status_led = None  # set by alarm_server
+        self._failed_led = None
+        # framed messages, from the serial reader to processor(), in a ring of buffers allocated once.
+        # _rx_count messages are waiting, starting at _rx_head; the reader fills the slot after them.
+        # uasyncio has no Queue, so the ring and an Event.
+        self._rx_buffers = [bytearray(BUFFER_SIZE) for _ in range(RX_QUEUE_SIZE)]
+        self._rx_lengths = [0] * RX_QUEUE_SIZE
+        self._rx_head = 0
+        self._rx_count = 0
+        self._rx_event = asyncio.Event()
+        # serial reader state, kept between reads.
+        self._buffer = self._rx_buffers[0]
+        self._offset = 0
+        self._reader_state = RS_INIT
+        self._activity_event = asyncio.Event()  # set when a message is received
+        # returned by get_status, allocated once.
+        self._status_data = {}
+        self._status = {'thunderbolt_data': self._status_data}
 
     def get_status(self):
-        return {'thunderbolt_data': {
-            'connected': self.connected,
-            'receiver_mode': self.receiver_mode,
-            'discipline_mode': self.discipline_mode,
-            'holdover_duration': self.holdover_duration,
-            'gps_status': self.gps_status,
-            'minor_alarms': self.minor_alarms,
-            'critical_alarms': self.critical_alarms,
-            'latitude': self.latitude,
-            'longitude': self.longitude,
-            'altitude': self.altitude,
-            'satellites': self.satellites,
-            'fix_dim': self.fix_dim,
-            'time_of_week': self.time_of_week,
-            'week_number': self.week_number,
-            'utc_offset': self.utc_offset,
-            'unixtime': self.get_datetime(),
-            'time': self.tm,
-        }
-        }
+        # the same dict is refreshed and returned each call, callers must not modify or keep it.
+        data = self._status_data
+        data['connected'] = self.connected
+        data['receiver_mode'] = self.receiver_mode
+        data['discipline_mode'] = self.discipline_mode
+        data['holdover_duration'] = self.holdover_duration
+        data['gps_status'] = self.gps_status
+        data['minor_alarms'] = self.minor_alarms
+        data['critical_alarms'] = self.critical_alarms
+        data['latitude'] = self.latitude
+        data['longitude'] = self.longitude
+        data['altitude'] = self.altitude
+        data['satellites'] = self.satellites
+        data['fix_dim'] = self.fix_dim
+        data['time_of_week'] = self.time_of_week
+        data['week_number'] = self.week_number
+        data['utc_offset'] = self.utc_offset
+        data['unixtime'] = self.get_datetime()
+        data['time'] = self.tm
+        return self._status
+
+    @property
+    def tm(self):
+        # formatted when asked for, not for every 0x8f-ab packet.
+        if self.hours < 0:
+            return ''
+        return f'{self.hours:02d}:{self.minutes:02d}:{self.seconds:02d}'
+
+    def _update_leds(self):
+        if self._status_led is None:
+            return  # alarm_server is not running.
+        if self.connected:
+            self._failed_led.off()
+        else:
+            self._failed_led.on()
+        if self.connected and self.minor_alarms == 0:
+            self._status_led.on()
+        else:
+            self._status_led.off()
 
     async def alarm_server(self, status_led, failed_led):
+        # the 0x8f-ac decoder updates the LEDs when the alarms change,
+        # this only has to notice when the thunderbolt goes quiet, or starts talking again.
+        self._status_led = status_led
+        self._failed_led = failed_led
+        activity = self._activity_event
+        gc_countdown = GC_PASSES
         while self.run:
-            await asyncio.sleep(1.0)
-            if self.last_seen_tm > milliseconds() - 5000:
-                self.connected = True
-                failed_led.off()
-            else:
-                self.connected = False
-                failed_led.on()
-            if self.connected and self.minor_alarms == 0:
-                status_led.on()
+            # last_seen_tm is 0 until the first message.
+            age = milliseconds_diff(milliseconds(), self.last_seen_tm)
+            self.connected = self.last_seen_tm != 0 and 0 <= age < STALE_MS
+            self._update_leds()
+            if self.connected:
+                gc_countdown -= 1
+                if gc_countdown == 0:
+                    gc_countdown = GC_PASSES
+                    gc.collect()
+                # sleep until the last message is STALE_MS old.
+                # messages arrive every second, so this wakes up about every STALE_MS.
+                await asyncio.sleep(min(STALE_MS - age, STALE_MS) / 1000)
             else:
-                status_led.off()
+                # there is nothing to update until the thunderbolt talks again, wait for that instead of polling.
+                gc.collect()
+                activity.clear()
+                await activity.wait()
 
     def get_datetime(self):
-        unix_time = GPS_EPOCH_AS_UNIX_TIME + self.week_number * WEEK_SECONDS + self.time_of_week - self.utc_offset
-        return get_timestamp_from_secs(unix_time)
+        # the timestamp only changes when a 0x8f-ab arrives, format it once per change.
+        unix_time = self.unix_time
+        if unix_time != self._datetime_secs:
+            self._datetime = get_timestamp_from_secs(unix_time)
+            self._datetime_secs = unix_time
+        return self._datetime
 
     async def serial_server(self):
-        reader_state = RS_INIT
-        buffer = bytearray(BUFFER_SIZE)
-        raw = bytearray(BUFFER_SIZE)
-        raw_offset = 0
-        offset = 0
         device_port = self.device_port
 
         # send init (8E A5) message to enable the messages I want.
-        message = b'\x10\x8e\xa5\x00\x45\x00\x00\x10\x03'
-        device_port.write(message)
-        device_port.flush()
+        # no flush(): the 9 bytes fit in the UART transmit buffer, and waiting for them to drain would block the loop.
+        device_port.write(INIT_8E_A5)
 
-        while self.run:
-            if device_port.any():
-                bs = device_port.read(1)
-                b = bs[0]
-                raw[raw_offset] = b
-                raw_offset += 1
-                # print(f'{reader_state}, {b:02x}, {offset}')
-                if reader_state == RS_INIT:
-                    if b == DLE:
-                        if offset != 0:
-                            logging.warning('data lost.', 'thunderbolt:serial_server:RS_INIT')
-                            logging.warning(f'buffer {offset}:\n' + hexdump_buffer(buffer[:offset]))
-                        reader_state = RS_READ
-                        offset = 0
-                        raw[0] = b
-                        raw_offset = 1
-                elif reader_state == RS_READ:
-                    if b == DLE:
-                        reader_state = RS_READ_DLE
-                    else:
-                        buffer[offset] = b
-                        offset += 1
-                elif reader_state == RS_READ_DLE:
-                    if b == ETX:
-                        self.last_seen_tm = milliseconds()  # there is serial traffic
-                        if not self.process_buffer(buffer, offset):
-                            print('error processing buffer!')
-                            print('raw bytes:\n' + hexdump_buffer(raw[0:raw_offset]))
-                        reader_state = RS_INIT
-                        offset = 0
-                        raw_offset = 0
+        # eliminate dict lookups in the loops
+        feed = self._feed
+        if upython:
+            # the stream read blocks until the UART has data, no need to poll.
+            read_async = device_port.read_async
+            while self.run:
+                feed(await read_async(BUFFER_SIZE))
+        else:
+            any_ = device_port.any
+            read = device_port.read
+            # have the event loop wake this task when the port is readable, if it can watch the port.
+            loop = asyncio.get_running_loop()
+            readable = asyncio.Event()
+            try:
+                fd = device_port.fileno()
+                loop.add_reader(fd, readable.set)
+            except (AttributeError, NotImplementedError, OSError, ValueError):
+                fd = None
+                readable = None
+            try:
+                while self.run:
+                    if readable is not None:
+                        readable.clear()
+                    n = any_()
+                    if n:
+                        feed(read(n))
+                        await asyncio.sleep(0)  # let processor() run before the next read.
+                    elif readable is not None:
+                        try:
+                            # the timeout is so self.run is checked even when the port is quiet.
+                            await asyncio.wait_for(readable.wait(), 1.0)
+                        except asyncio.TimeoutError:
+                            pass
                     else:
-                        buffer[offset] = b
-                        offset += 1
-                        reader_state = RS_READ
-                else:
-                    logging.error('Unhandled reader state')
-                if offset >= BUFFER_SIZE:
+                        await asyncio.sleep(0.020)  # wait 20 ms for more traffic
+            finally:
+                if fd is not None:
+                    loop.remove_reader(fd)
+
+    def _feed(self, chunk):
+        """
+        frame TSIP messages out of a chunk of serial data.
+        runs of non-DLE bytes are located with find() and copied into the buffer with one slice assignment,
+        so the python code only runs for each DLE, not for each byte.
+        a message may span more than one chunk, so the reader state is kept in self between calls.
+        """
+        buffer = self._buffer
+        offset = self._offset
+        reader_state = self._reader_state
+        # eliminate dict lookups in the loop
+        find = chunk.find
+        dle_bytes = DLE_BYTES
+        mv = memoryview(chunk)
+        chunk_len = len(chunk)
+        i = 0
+        while i < chunk_len:
+            if reader_state == RS_INIT:
+                j = find(dle_bytes, i)
+                if j < 0:
+                    break  # no start of message in this chunk.
+                if offset != 0 and logging.should_log(logging.WARNING):
+                    logging.warning('data lost.', 'thunderbolt:serial_server:RS_INIT')
+                    logging.warning(f'buffer {offset}:\n' + hexdump_buffer(buffer, offset))
+                reader_state = RS_READ
+                offset = 0
+                i = j + 1
+            elif reader_state == RS_READ:
+                j = find(dle_bytes, i)
+                end = chunk_len if j < 0 else j
+                run_len = end - i
+                if offset + run_len >= BUFFER_SIZE:
                     logging.error('buffer overrun!', 'thunderbolt:serial_server')
                     offset = 0
                     reader_state = RS_INIT
-                if raw_offset >= BUFFER_SIZE:
-                    logging.error('raw (debugging) buffer overflow!')
-                    logging.error('raw_buffer:\n' + hexdump_buffer(raw))
-                    raw_offset = 0
-            else:
-                await asyncio.sleep(0.020)  # wait 20 ms for more traffic
+                    i = end
+                    continue
+                buffer[offset:offset + run_len] = mv[i:end]
+                offset += run_len
+                if j < 0:
+                    break  # message continues in the next chunk.
+                reader_state = RS_READ_DLE
+                i = j + 1
+            else:  # RS_READ_DLE
+                b = chunk[i]
+                i += 1
+                if b == ETX:
+                    self.last_seen_tm = milliseconds() or 1  # there is serial traffic, 0 means never
+                    self._activity_event.set()
+                    # queue this buffer, and read the next message into the following one.
+                    rx_count = self._rx_count
+                    self._rx_lengths[(self._rx_head + rx_count) % RX_QUEUE_SIZE] = offset
+                    rx_count += 1
+                    if rx_count == RX_QUEUE_SIZE:
+                        # the only free buffer is the oldest message's.
+                        logging.warning('receive queue full, message dropped.', 'thunderbolt:serial_server')
+                        self._rx_head = (self._rx_head + 1) % RX_QUEUE_SIZE
+                        rx_count -= 1
+                    self._rx_count = rx_count
+                    buffer = self._rx_buffers[(self._rx_head + rx_count) % RX_QUEUE_SIZE]
+                    self._buffer = buffer
+                    self._rx_event.set()
+                    reader_state = RS_INIT
+                    offset = 0
+                else:
+                    # DLE DLE is a stuffed DLE data byte.
+                    buffer[offset] = b
+                    offset += 1
+                    reader_state = RS_READ
+        self._offset = offset
+        self._reader_state = reader_state
+
+    async def processor(self):
+        # decode the messages framed by serial_server, so decoding does not delay the serial reads.
+        rx_buffers = self._rx_buffers
+        rx_lengths = self._rx_lengths
+        rx_event = self._rx_event
+        process_buffer = self.process_buffer
+        while self.run:
+            if self._rx_count == 0:
+                rx_event.clear()
+                await rx_event.wait()
+                continue
+            head = self._rx_head
+            if not process_buffer(rx_buffers[head], rx_lengths[head]):
+                # process_buffer has already logged the packet.
+                logging.warning('error processing buffer!', 'thunderbolt:processor')
+            self._rx_head = (head + 1) % RX_QUEUE_SIZE
+            self._rx_count -= 1
 
     def process_buffer(self, buffer, offset):
         pkt_id = buffer[0]
-        # logging.debug(f'packet ID {pkt_id:02x}', 'Thunderbolt:process_buffer')
+        # logging.debug('packet ID %02x', 'Thunderbolt:process_buffer', pkt_id)
         if pkt_id in ignore_packets:
             return True
-        try:
-            if pkt_id == 0x13:
-                # This is documented in the Thunderbolt E GPS Disciplined Clock User Guide, page 41
-                # It indicates that a packet was received that the Thunderbolt does not recognise.
-                bad_cmd = buffer[1]
-                if bad_cmd == 0x1c:
-                    # command 0x1c is not supported by Thunderbolt, but is supported by Thunderbolt-E
-                    # quietly eat this error report.
-                    return True
-                elif bad_cmd == 0x3c:  # request satellite tracking status
-                    sat_number = buffer[2]
-                    if sat_number > 32:
-                        #  Lady Heather appears to have a bug and is requesting satellite tracking
-                        #  for satellites numbered > 32.  This should not be reported.
-                        return True
-                elif bad_cmd == 0x8e:
-                    sub_cmd = buffer[2]
-                    if sub_cmd == 0x4e:
-                        #  0x8e 0x4e (PPS output qualifier) is not supported by Thunderbolt,
-                        #  but is supported by Thunderbolt-E. Quietly eat this error.
-                        return True
-                logging.warning(f'unparsable packet 0x013, len={offset}', 'thunderbolt:process_buffer:0x13')
-                logging.warning('\n' + hexdump_buffer(buffer[:offset]))
-            elif pkt_id == 0x6d:
-                # see Section A.9.34 in Thunderbolt Book, page A-29
-                # logging.debug(f'satellite selection list, len={offset}', 'thunderbolt:process_buffer:0x6d')
-                # print(hexdump_buffer(buffer[:offset]))
-                num_sats = offset - 18
-                # logging.debug(f'num_sats={num_sats}', 'thunderbolt:process_buffer:0x6d')
-                fmt = '>xBffff' + 'b' * num_sats
-                # print(f'fmt = {fmt}')
-                # print(f'size={struct.calcsize(fmt)}')
-                stuff = struct.unpack(fmt, buffer[:offset])
-                # print(stuff)
-                bm = stuff[0]
-                # logging.info(f'bits={bm:08b}', 'thunderbolt:process_buffer:0x6d')
-                # results include
-                # 00 bit field uchar
-                # 01 PDOP float
-                # 02 HDOP float
-                # 03 VDOP float
-                # 04 PDOP float
-                # 05-end PRN # char (list)
-                fix_dim = (bm & 0x07)
-                if fix_dim == 0:
-                    self.fix_dim = 0  # no fix
-                elif fix_dim == 1:
-                    self.fix_dim = 1  # 1d Clock fix
-                elif fix_dim == 3:
-                    self.fix_dim = 2  # 2d fix
-                elif fix_dim == 4:
-                    self.fix_dim = 3  # 3d fix
-                elif fix_dim == 5:
-                    self.fix_dim = 5  # OD Clock Fix
-                else:
-                    logging.warning(f'fix_dim {fix_dim} not implemented', 'thunderbolt:process_buffer:0x6d')
-                    logging.warning(f'bm bits: {bm:08b}, fix_dim bits: {fix_dim:03b}',
-                                    'thunderbolt:process_buffer:0x6d')
-                    self.fix_dim = 0
-                num_sats = (bm & 0xf0) >> 4
-                # logging.debug(f'fix_dim = {self.fix_dim}, num_sats = {num_sats}',  'thunderbolt:process_buffer:0x6d')
-                self.satellites = sorted(list(stuff[5:]))
-                # print(stuff)
-                # print(self.fix_dim, self.pdop, self.hdop, self.vdop, self.tdop, self.satellites)
-                # print()
-            elif pkt_id == 0x8f:
-                pkt_sub_id = buffer[1]
-                if pkt_sub_id in ignore_8f_packets:
-                    return True
-                # logging.debug(f'packet ID 8f {pkt_sub_id:02x}', 'Thunderbolt:process_buffer')
-
-                if pkt_sub_id == 0xab:
-                    # see Section A.10.30 in Thunderbolt Book, page A-56
-                    # logging.debug(f'primary timing packet, len={offset}', 'thunderbolt:process_buffer:0x8f 0xab')
-                    # print(hexdump_buffer(buffer[:offset]))
-                    fmt = '>xxIHhBBBBBBH'
-                    # results include:
-                    # 00 time-of-week
-                    # 01 week number
-                    # 02 UTC offset seconds
-                    # 03 timing flag
-                    # 04 seconds
-                    # 05 minutes
-                    # 06 hours
-                    # 07 day of month
-                    # 08 month
-                    # 09 year
-                    # print(f'fmt = {fmt}')
-                    # print(f'size={struct.calcsize(fmt)}')
-                    stuff = struct.unpack(fmt, buffer[:offset])
-                    # print(stuff)
-                    self.time_of_week = stuff[0]
-                    self.week_number = stuff[1] + 1024  # week number has wrapped again.
-                    self.utc_offset = stuff[2]
-                    # print(f'{stuff[3]}')
-                    # calculate time as unix time
-                    self.tm = f'{stuff[6]:02d}:{stuff[5]:02d}:{stuff[4]:02d}'
-                    # logging.debug(f'time: {self.tm}', 'thunderbolt:process_buffer:0x8f 0xab')
-                    self.connected = True
-                elif pkt_sub_id == 0xac:
-                    # see Section A.10.31 in Thunderbolt Book, page A-59
-                    # logging.debug(f'secondary timing packet, len={offset}', 'thunderbolt::0x8f 0xac')
-                    # print(hexdump_buffer(buffer[:offset]))
-                    fmt = '>xxBBBIHHBBBBffIffdddxxxxxxxx'
-                    # print(f'fmt = {fmt}')
-                    # print(f'size={struct.calcsize(fmt)}')
-                    # results contain tuple of
-                    #  0 receiver mode uint8
-                    #  1 disciplining mode uint8
-                    #  2 self-survey progress uint8
-                    #  3 holdover duration sec uint32
-                    #  4 critical alarms bitmask uint16
-                    #  5 minor alarms bitmask uint16
-                    #  6 gps decoding status uint8
-                    #  7 disciplining activity uint8
-                    #  8 spare status 1 uint8
-                    #  9 spare status 2 uint8
-                    # 10 pps offset ns float
-                    # 11 10 mhz offset PPB float
-                    # 12 DAC value uint32
-                    # 13 DAC voltage volts float
-                    # 14 temperature degrees C float
-                    # 15 latitude radians double
-                    # 16 longitude radians double
-                    # 17 altitude meters double
-                    #    8 bytes ignored
-                    stuff = struct.unpack(fmt, buffer[:offset])
-                    # print(stuff)
-                    # logging.debug(f'receiver mode {stuff[0]}, disciplining mode {stuff[1]}, critical alarms {stuff[4]}, minor alarms {stuff[5]}, gps status {stuff[6]}',                                  'thunderbolt:process_buffer:0x8f 0xac')
-                    self.receiver_mode = stuff[0]
-                    self.discipline_mode = stuff[1]
-                    self.holdover_duration = stuff[3]
-                    self.critical_alarms = stuff[4]
-                    self.minor_alarms = stuff[5]
-                    self.gps_status = stuff[6]
-                    self.latitude = stuff[15]
-                    self.longitude = stuff[16]
-                    self.altitude = stuff[17]
-                else:
-                    logging.warning(f'unknown packet type 8f {pkt_sub_id:02x}', 'thunderbolt:process_buffer')
-                    logging.warning('buffer:\n' + hexdump_buffer(buffer[:offset]))
-                    return False
-            else:
+        handler = self._packet_handlers.get(pkt_id)
+        if handler is None:
+            if logging.should_log(logging.WARNING):
                 logging.warning(f'unknown packet type {pkt_id:02x}', 'thunderbolt:process_buffer')
-                logging.warning('buffer:\n' + hexdump_buffer(buffer[:offset]))
-                return False
+                logging.warning('buffer:\n' + hexdump_buffer(buffer, offset))
+            return False
+        try:
+            return handler(self, buffer, offset)
         except Exception as exc:
             logging.error(str(exc), 'thunderbolt:process_buffer:Exception')
-        gc.collect()
+            return True
+
+    def _handle_13(self, buffer, offset):
+        # This is documented in the Thunderbolt E GPS Disciplined Clock User Guide, page 41
+        # It indicates that a packet was received that the Thunderbolt does not recognise.
+        bad_cmd = buffer[1]
+        if bad_cmd == 0x1c:
+            # command 0x1c is not supported by Thunderbolt, but is supported by Thunderbolt-E
+            # quietly eat this error report.
+            return True
+        elif bad_cmd == 0x3c:  # request satellite tracking status
+            sat_number = buffer[2]
+            if sat_number > 32:
+                #  Lady Heather appears to have a bug and is requesting satellite tracking
+                #  for satellites numbered > 32.  This should not be reported.
+                return True
+        elif bad_cmd == 0x8e:
+            sub_cmd = buffer[2]
+            if sub_cmd == 0x4e:
+                #  0x8e 0x4e (PPS output qualifier) is not supported by Thunderbolt,
+                #  but is supported by Thunderbolt-E. Quietly eat this error.
+                return True
+        if logging.should_log(logging.WARNING):
+            logging.warning(f'unparsable packet 0x013, len={offset}', 'thunderbolt:process_buffer:0x13')
+            logging.warning('\n' + hexdump_buffer(buffer, offset))
+        return True
+
+    def _handle_6d(self, buffer, offset):
+        # see Section A.9.34 in Thunderbolt Book, page A-29
+        # logging.debug('satellite selection list, len=%d', 'thunderbolt:process_buffer:0x6d', offset)
+        # print(hexdump_buffer(buffer, offset))
+        num_sats = offset - PRN_6D_OFFSET
+        # logging.debug('num_sats=%d', 'thunderbolt:process_buffer:0x6d', num_sats)
+        if not 0 <= num_sats <= MAX_6D_SATS:
+            # unpack_from does not check the packet length, so a bad length is caught here.
+            logging.error('bad 0x6d packet length %d', 'thunderbolt:process_buffer:0x6d', offset)
+            return True
+        # packet contains
+        # 00 packet ID
+        # 01 bit field uchar
+        # 02 PDOP float
+        # 06 HDOP float
+        # 10 VDOP float
+        # 14 TDOP float
+        # 18-end PRN # char (list)
+        # the DOPs are not used, so only the bit field and the PRNs are unpacked.
+        bm = buffer[1]
+        # logging.info(f'bits={bm:08b}', 'thunderbolt:process_buffer:0x6d')
+        fix_dim = (bm & 0x07)
+        self.fix_dim = FIX_DIM_MAP[fix_dim]
+        if self.fix_dim == 0 and fix_dim != 0:
+            if logging.should_log(logging.WARNING):
+                logging.warning(f'fix_dim {fix_dim} not implemented', 'thunderbolt:process_buffer:0x6d')
+                logging.warning(f'bm bits: {bm:08b}, fix_dim bits: {fix_dim:03b}',
+                                'thunderbolt:process_buffer:0x6d')
+        # the PRN count comes from the packet length, checked above, not from the bit field's (bm & 0xf0) >> 4.
+        # logging.debug('fix_dim = %d, num_sats = %d', 'thunderbolt:process_buffer:0x6d', self.fix_dim, num_sats)
+        satellites = self.satellites  # reuse the list, do not build a new one per packet.
+        satellites[:] = struct.unpack_from(get_6d_format(num_sats), buffer, PRN_6D_OFFSET)
+        satellites.sort()
+        # print(self.fix_dim, self.pdop, self.hdop, self.vdop, self.tdop, self.satellites)
+        # print()
+        return True
+
+    def _handle_8f(self, buffer, offset):
+        pkt_sub_id = buffer[1]
+        if pkt_sub_id in ignore_8f_packets:
+            return True
+        # logging.debug('packet ID 8f %02x', 'Thunderbolt:process_buffer', pkt_sub_id)
+        handler = self._packet_8f_handlers.get(pkt_sub_id)
+        if handler is None:
+            if logging.should_log(logging.WARNING):
+                logging.warning(f'unknown packet type 8f {pkt_sub_id:02x}', 'thunderbolt:process_buffer')
+                logging.warning('buffer:\n' + hexdump_buffer(buffer, offset))
+            return False
+        return handler(self, buffer, offset)
+
+    def _handle_8f_ab(self, buffer, offset):
+        # see Section A.10.30 in Thunderbolt Book, page A-56
+        # logging.debug('primary timing packet, len=%d', 'thunderbolt:process_buffer:0x8f 0xab', offset)
+        # print(hexdump_buffer(buffer, offset))
+        # results include:
+        # 00 time-of-week
+        # 01 week number
+        # 02 UTC offset seconds
+        # 03 timing flag
+        # 04 seconds
+        # 05 minutes
+        # 06 hours
+        # 07 day of month
+        # 08 month
+        # 09 year
+        if offset != LEN_8F_AB:
+            # unpack_from does not check the packet length, so a bad length is caught here.
+            logging.error('bad 0x8f-ab packet length %d', 'thunderbolt:process_buffer:0x8f 0xab', offset)
+            return True
+        stuff = struct.unpack_from(FMT_8F_AB, buffer)
+        # print(stuff)
+        self.time_of_week = stuff[0]
+        self.week_number = stuff[1] + 1024  # week number has wrapped again.
+        self.utc_offset = stuff[2]
+        # print(f'{stuff[3]}')
+        # calculate time as unix time
+        self.unix_time = GPS_EPOCH_AS_UNIX_TIME + self.week_number * WEEK_SECONDS + stuff[0] - stuff[2]
+        self.hours = stuff[6]
+        self.minutes = stuff[5]
+        self.seconds = stuff[4]
+        # logging.debug('time: %s', 'thunderbolt:process_buffer:0x8f 0xab', self.tm)
+        self.connected = True
         return True
 
+    def _handle_8f_ac(self, buffer, offset):
+        # see Section A.10.31 in Thunderbolt Book, page A-59
+        # logging.debug('secondary timing packet, len=%d', 'thunderbolt::0x8f 0xac', offset)
+        # print(hexdump_buffer(buffer, offset))
+        # results contain tuple of
+        #  0 receiver mode uint8
+        #  1 disciplining mode uint8
+        #  2 self-survey progress uint8
+        #  3 holdover duration sec uint32
+        #  4 critical alarms bitmask uint16
+        #  5 minor alarms bitmask uint16
+        #  6 gps decoding status uint8
+        #  7 disciplining activity uint8
+        #  8 spare status 1 uint8
+        #  9 spare status 2 uint8
+        # 10 pps offset ns float
+        # 11 10 mhz offset PPB float
+        # 12 DAC value uint32
+        # 13 DAC voltage volts float
+        # 14 temperature degrees C float
+        # 15 latitude radians double
+        # 16 longitude radians double
+        # 17 altitude meters double
+        #    8 bytes ignored
+        if offset != LEN_8F_AC:
+            # unpack_from does not check the packet length, so a bad length is caught here.
+            logging.error('bad 0x8f-ac packet length %d', 'thunderbolt:process_buffer:0x8f 0xac', offset)
+            return True
+        stuff = struct.unpack_from(FMT_8F_AC, buffer)
+        # print(stuff)
+        # logging.debug('receiver mode %d, disciplining mode %d, critical alarms %d, minor alarms %d, gps status %d',
+        #               'thunderbolt:process_buffer:0x8f 0xac', stuff[0], stuff[1], stuff[4], stuff[5], stuff[6])
+        self.receiver_mode = stuff[0]
+        self.discipline_mode = stuff[1]
+        self.holdover_duration = stuff[3]
+        self.critical_alarms = stuff[4]
+        minor_alarms = stuff[5]
+        if minor_alarms != self.minor_alarms:
+            self.minor_alarms = minor_alarms
+            self._update_leds()
+        self.gps_status = stuff[6]
+        self.latitude = stuff[15]
+        self.longitude = stuff[16]
+        self.altitude = stuff[17]
+        return True
+
+    # packet dispatch tables, packet ID -> handler.  built once, when the class is defined.
+    _packet_handlers = {
+        0x13: _handle_13,
+        0x6d: _handle_6d,
+        0x8f: _handle_8f,
+    }
+    _packet_8f_handlers = {
+        0xab: _handle_8f_ab,
+        0xac: _handle_8f_ac,
+    }
+
+
+def get_6d_format(num_sats):
+    fmt = _fmt_6d_cache.get(num_sats)
+    if fmt is None:
+        fmt = 'b' * num_sats
+        _fmt_6d_cache[num_sats] = fmt
+    return fmt
+
 
-def hexdump_buffer(buffer):
-    result = ''
-    hex_bytes = ''
-    printable = ''
-    offset = 0
-    ofs = '{:04x}'.format(offset)
-    for b in buffer:
-        hex_bytes += '{:02x} '.format(b)
-        printable += chr(b) if 32 <= b <= 126 else '.'
-        offset += 1
-        if len(hex_bytes) >= 48:
-            result += ofs + '  ' + hex_bytes + '  ' + printable + '\n'
-            hex_bytes = ''
-            printable = ''
-            ofs = '{:04x}'.format(offset)
-    if len(hex_bytes) > 0:
-        hex_bytes += ' ' * 47
-        hex_bytes = hex_bytes[0:47]
-        result += ofs + '  ' + hex_bytes + '   ' + printable + '\n'
-    return result
+def hexdump_buffer(buffer, length=None):
+    # length allows dumping the front of a larger buffer without slicing (copying) it.
+    if length is None:
+        length = len(buffer)
+    mv = memoryview(buffer)
+    # eliminate dict lookups in the loop
+    hexlify = binascii.hexlify
+    printable_chars = PRINTABLE_CHARS
+    lines = []
+    for offset in range(0, length, 16):
+        row = mv[offset:min(offset + 16, length)]
+        hex_bytes = hexlify(row, ' ').decode()
+        printable = ''.join([printable_chars[b] for b in row])
+        lines.append('{:04x}  {:<47}   {}\n'.format(offset, hex_bytes, printable))
+    return ''.join(lines)
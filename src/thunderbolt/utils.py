@@ -45,7 +45,25 @@ def milliseconds():
     return time.ticks_ms() if upython else int(time.time() * 1000)
 
 
+def milliseconds_diff(new, old):
+    # milliseconds() wraps on micropython, ticks_diff() allows for that.
+    return time.ticks_diff(new, old) if upython else new - old
+
+
 def safe_int(value, default=-1):
     if isinstance(value, int):
         return value
     return int(value) if value.isdigit() else default
+
+
+def valid_ipv4(value):
+    # dotted quad check, micropython's socket module has no inet_aton().
+    if not isinstance(value, str):
+        return False
+    parts = value.split('.')
+    if len(parts) != 4:
+        return False
+    for part in parts:
+        if not part.isdigit() or len(part) > 3 or int(part) > 255:
+            return False
+    return True